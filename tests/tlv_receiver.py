@@ -8,11 +8,17 @@ It can handle both signaling and audio packets according to the TLV protocol.
 
 import socket
 import struct
+import ctypes
+import errno
+import select
 import json
 import time
 import os
+import sys
+import functools
+import heapq
+import threading
 from datetime import datetime
-from collections import defaultdict
 
 # Packet type constants
 PACKET_TYPE_SIGNALING = 0x01
@@ -22,93 +28,183 @@ PACKET_TYPE_AUDIO = 0x02
 DIRECTION_RX = 0x01
 DIRECTION_TX = 0x02
 
+# Streams with no packets in either direction for this long are saved and dropped
+STREAM_TIMEOUT = 30  # seconds
+# How often the receive loop checks for inactive streams
+CLEANUP_INTERVAL = 1.0  # seconds
+
+# Per-packet audio logging (set FORKSTREAM_VERBOSE=1 to enable)
+VERBOSE = os.environ.get('FORKSTREAM_VERBOSE', '0') == '1'
+# Number of receive sockets/threads sharing the port via SO_REUSEPORT (at least 1)
+WORKERS = max(1, int(os.environ.get('FORKSTREAM_WORKERS', '1')))
+# Requested kernel receive buffer per socket, to absorb bursts
+RECV_BUFFER_SIZE = 8 * 1024 * 1024
+# Datagrams fetched per recvmmsg(2) call (set FORKSTREAM_BATCH=1 to use recvfrom)
+RECV_BATCH = int(os.environ.get('FORKSTREAM_BATCH', '64'))
+# Output directory for recordings, created at startup
+RECORDINGS_DIR = "recordings"
+# Userspace write buffer for each open recording file (about a minute of
+# 8kHz 16-bit audio per write syscall)
+AUDIO_WRITE_BUFFER = 1 << 20
+# Per-datagram receive buffer. packet_length is a uint16, so this fits any
+# valid packet (and any UDP datagram); a full batch costs RECV_BATCH * 64KB
+RECV_SLOT_SIZE = 65536
+
+# Precompiled wire formats (network byte order)
+# Header: packet_type(1), packet_length(2), stream_id(4), direction(1)
+_HDR_STRUCT = struct.Struct('!BHIB')
+# Signaling payload: channel_id(64), exten(32), caller_id(32), called_id(32), timestamp(4)
+_SIG = struct.Struct('!64s32s32s32sI')
+# Audio sequence number: uint32 at the start of the payload
+_SEQ = struct.Struct('!I')
+
+# recvmmsg(2) through ctypes (Linux only; falls back to recvfrom_into elsewhere)
+class _IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [('sin_family', ctypes.c_ushort), ('sin_port', ctypes.c_uint16),
+                ('sin_addr', ctypes.c_ubyte * 4), ('sin_zero', ctypes.c_ubyte * 8)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_IOVec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+try:
+    _recvmmsg = ctypes.CDLL(None, use_errno=True).recvmmsg
+    _recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    _recvmmsg.restype = ctypes.c_int
+except (OSError, AttributeError):
+    _recvmmsg = None
+
+_DIR_STR = {DIRECTION_RX: "RX", DIRECTION_TX: "TX"}
+
 def direction_to_string(direction):
     """Convert direction byte to string"""
-    if direction == DIRECTION_RX:
-        return "RX"
-    elif direction == DIRECTION_TX:
-        return "TX"
-    else:
-        return f"UNKNOWN({direction})"
+    return _DIR_STR.get(direction) or f"UNKNOWN({direction})"
+
+def _now_str():
+    """Current wall-clock time for log lines, with millisecond precision"""
+    return datetime.now().strftime('%H:%M:%S.%f')[:-3]
+
+@functools.lru_cache(maxsize=256)
+def _fmt_ts(timestamp):
+    """Format a signaling UNIX timestamp for display (cached per second)"""
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+def _decode_cstr(field):
+    """Decode a fixed-width, NUL-terminated C string field"""
+    return field.split(b'\x00', 1)[0].decode('utf-8')
+
+# Characters rewritten when caller/called IDs are used in recording filenames
+_FILENAME_TRANS = str.maketrans({' ': '_', '<': None, '>': None})
+
+class SigPayload:
+    """Decoded signaling payload (call metadata for one stream direction)"""
+    __slots__ = ('channel_id', 'exten', 'caller_id', 'called_id', 'timestamp',
+                 'caller_clean', 'called_clean')
+
+class StreamBuffer:
+    """Open recording files, call info and last activity for both directions of a stream"""
+    __slots__ = ('rx_file', 'tx_file', 'rx_bytes', 'tx_bytes', 'rx_failed', 'tx_failed',
+                 'rx_info', 'tx_info', 'last_rx', 'last_tx')
+
+    def __init__(self):
+        # Opened on the first audio packet in each direction
+        self.rx_file = None
+        self.tx_file = None
+        self.rx_bytes = 0
+        self.tx_bytes = 0
+        # Set once opening or writing a direction's file fails; its audio is dropped
+        self.rx_failed = False
+        self.tx_failed = False
+        self.rx_info = None
+        self.tx_info = None
+        # time.monotonic() of the last packet in each direction, 0.0 if none yet
+        self.last_rx = 0.0
+        self.last_tx = 0.0
 
 def parse_forkstream_header(data):
-    """Parse the 8-byte TLV header"""
-    if len(data) < 8:
+    """Parse the 8-byte TLV header.
+
+    Returns (packet_type, packet_length, stream_id, direction) or None.
+    """
+    if len(data) < _HDR_STRUCT.size:
         return None
     
-    # Unpack header: packet_type(1), packet_length(2), stream_id(4), direction(1)
-    packet_type, packet_length, stream_id, direction = struct.unpack('!BHI B', data[:8])
-    
-    return {
-        'packet_type': packet_type,
-        'packet_length': packet_length,
-        'stream_id': stream_id,
-        'direction': direction
-    }
+    return _HDR_STRUCT.unpack_from(data)
 
 def parse_signaling_packet(data):
     """Parse signaling packet payload"""
-    if len(data) < 164:  # 64+32+32+32+4 = 164 bytes
+    if len(data) < _SIG.size:  # 64+32+32+32+4 = 164 bytes
         return None
     
     # Unpack signaling payload
-    channel_id = data[:64].decode('utf-8').rstrip('\x00')
-    exten = data[64:96].decode('utf-8').rstrip('\x00') 
-    caller_id = data[96:128].decode('utf-8').rstrip('\x00')
-    called_id = data[128:160].decode('utf-8').rstrip('\x00')
-    timestamp = struct.unpack('!I', data[160:164])[0]
+    channel_id, exten, caller_id, called_id, timestamp = _SIG.unpack_from(data)
+    payload = SigPayload()
+    payload.channel_id = _decode_cstr(channel_id)
+    payload.exten = _decode_cstr(exten)
+    payload.caller_id = _decode_cstr(caller_id)
+    payload.called_id = _decode_cstr(called_id)
+    payload.timestamp = timestamp
     
-    return {
-        'channel_id': channel_id,
-        'exten': exten,
-        'caller_id': caller_id,
-        'called_id': called_id,
-        'timestamp': timestamp,
-        'timestamp_str': datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
-    }
+    # Filename-safe versions of the IDs, used when the recording is saved
+    payload.caller_clean = payload.caller_id.translate(_FILENAME_TRANS)
+    payload.called_clean = payload.called_id.translate(_FILENAME_TRANS)
+    
+    return payload
 
 def parse_audio_packet(data):
-    """Parse audio packet payload"""
-    if len(data) < 4:
+    """Parse audio packet payload.
+
+    Returns (sequence, audio_data) or None. audio_data is a memoryview
+    into the receive buffer and must be copied if kept.
+    """
+    if len(data) < _SEQ.size:
         return None
     
     # Unpack audio payload header
-    sequence = struct.unpack('!I', data[:4])[0]
-    audio_data = data[4:]
+    sequence = _SEQ.unpack_from(data)[0]
+    audio_data = memoryview(data)[_SEQ.size:]
     
-    return {
-        'sequence': sequence,
-        'audio_length': len(audio_data),
-        'audio_data': audio_data
-    }
+    return (sequence, audio_data)
 
-def save_audio_file(stream_id, direction, audio_data, call_info):
-    """Save accumulated audio data to a file"""
-    # Create recordings directory if it doesn't exist
-    recordings_dir = "recordings"
-    if not os.path.exists(recordings_dir):
-        os.makedirs(recordings_dir)
-    
+def open_audio_file(stream_id, direction):
+    """Open the in-progress recording file for one direction of a stream.
+
+    Audio is written as it arrives; close_audio_file() gives the file its
+    final name once the stream ends.
+    """
+    direction_str = direction_to_string(direction)
+    filename = f"{RECORDINGS_DIR}/stream_{stream_id}_{direction_str}.raw.part"
+    return open(filename, 'wb', buffering=AUDIO_WRITE_BUFFER)
+
+def close_audio_file(stream_id, direction, audio_file, audio_length, call_info):
+    """Close a recording file and rename it after the call"""
     # Create filename with timestamp and call info
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    timestamp = time.strftime('%Y%m%d_%H%M%S')
     direction_str = direction_to_string(direction)
     
-    # Clean up call info for filename
-    caller_clean = call_info.get('caller_id', 'unknown').replace(' ', '_').replace('<', '').replace('>', '')
-    called_clean = call_info.get('called_id', 'unknown').replace(' ', '_').replace('<', '').replace('>', '')
+    caller_clean = call_info.caller_clean if call_info else 'unknown'
+    called_clean = call_info.called_clean if call_info else 'unknown'
     
-    filename = f"{recordings_dir}/stream_{stream_id}_{direction_str}_{timestamp}_{caller_clean}_to_{called_clean}.raw"
+    filename = f"{RECORDINGS_DIR}/stream_{stream_id}_{direction_str}_{timestamp}_{caller_clean}_to_{called_clean}.raw"
     
     try:
-        with open(filename, 'wb') as f:
-            f.write(audio_data)
+        audio_file.close()
+        os.replace(audio_file.name, filename)
         
         # Calculate duration (assuming 8kHz, 16-bit, mono)
         # Each sample is 2 bytes, so duration = bytes / (8000 * 2)
-        duration_sec = len(audio_data) / (8000 * 2)
+        duration_sec = audio_length / (8000 * 2)
         
         print(f"Saved {direction_str} audio: {filename}")
-        print(f"  Size: {len(audio_data):,} bytes")
+        print(f"  Size: {audio_length:,} bytes")
         print(f"  Duration: {duration_sec:.2f} seconds")
         
         return filename
@@ -116,22 +212,18 @@ def save_audio_file(stream_id, direction, audio_data, call_info):
         print(f"Error saving audio file {filename}: {e}")
         return None
 
-def main():
-    # Configuration
-    listen_ip = '0.0.0.0'
-    listen_port = 4444
-    
-    print(f"TLV UDP Receiver starting on {listen_ip}:{listen_port}")
-    print("Waiting for packets from ForkStream module...")
-    print("Audio recordings will be saved to 'recordings/' directory")
-    print("-" * 60)
-    
-    # Create UDP socket
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind((listen_ip, listen_port))
-    
-    # Statistics
-    stats = {
+def save_stream_audio(stream_id, stream):
+    """Close and name the recording files for both directions of a stream"""
+    if stream.rx_file is not None:
+        close_audio_file(stream_id, DIRECTION_RX, stream.rx_file, stream.rx_bytes, stream.rx_info)
+        stream.rx_file = None
+    if stream.tx_file is not None:
+        close_audio_file(stream_id, DIRECTION_TX, stream.tx_file, stream.tx_bytes, stream.tx_info)
+        stream.tx_file = None
+
+def new_stats():
+    """Create an empty statistics dict"""
+    return {
         'signaling_rx': 0,
         'signaling_tx': 0,
         'audio_rx': 0,
@@ -139,146 +231,323 @@ def main():
         'total_audio_bytes': 0,
         'errors': 0
     }
+
+def create_socket(listen_ip, listen_port, reuse_port):
+    """Create and bind a UDP receive socket"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_SIZE)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    # Wake up periodically so the worker notices shutdown
+    sock.settimeout(0.5)
+    sock.bind((listen_ip, listen_port))
+    return sock
+
+def make_batch_receiver(sock, batch_size=RECV_BATCH):
+    """Build a function that receives the next batch of datagrams from sock.
+
+    The returned function yields a sequence of (data, addr) pairs, empty if the
+    socket timeout expires. data is a memoryview into a buffer that is reused
+    by the next call, so anything kept must be copied out.
+    """
+    if _recvmmsg is None or batch_size <= 1:
+        recv_buf = bytearray(RECV_SLOT_SIZE)
+        recv_view = memoryview(recv_buf)
+        recv_into = sock.recvfrom_into
+        
+        def receive():
+            try:
+                nbytes, addr = recv_into(recv_buf)
+            except socket.timeout:
+                return ()
+            return ((recv_view[:nbytes], addr),)
+        
+        return receive
+    
+    fd = sock.fileno()
+    recv_buf = bytearray(batch_size * RECV_SLOT_SIZE)
+    recv_view = memoryview(recv_buf)
+    slots = [recv_view[i * RECV_SLOT_SIZE:(i + 1) * RECV_SLOT_SIZE] for i in range(batch_size)]
+    base = ctypes.addressof(ctypes.c_char.from_buffer(recv_buf))
+    
+    iovecs = (_IOVec * batch_size)()
+    names = (_SockAddrIn * batch_size)()
+    msgs = (_MMsgHdr * batch_size)()
+    for i in range(batch_size):
+        iovecs[i].iov_base = base + i * RECV_SLOT_SIZE
+        iovecs[i].iov_len = RECV_SLOT_SIZE
+        hdr = msgs[i].msg_hdr
+        hdr.msg_name = ctypes.addressof(names[i])
+        hdr.msg_namelen = ctypes.sizeof(_SockAddrIn)
+        hdr.msg_iov = ctypes.pointer(iovecs[i])
+        hdr.msg_iovlen = 1
     
+    # The socket has a timeout, so its fd is non-blocking; wait with poll()
+    # only when the queue is empty
+    poller = select.poll()
+    poller.register(fd, select.POLLIN)
+    timeout = sock.gettimeout()
+    timeout_ms = -1 if timeout is None else int(timeout * 1000)
+    
+    def recv_batch():
+        count = _recvmmsg(fd, msgs, batch_size, socket.MSG_DONTWAIT, None)
+        if count < 0:
+            err = ctypes.get_errno()
+            if err not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                raise OSError(err, os.strerror(err))
+            return 0
+        return count
+    
+    def receive():
+        count = recv_batch()
+        if not count:
+            if not poller.poll(timeout_ms):
+                return ()
+            count = recv_batch()
+        return [
+            (slots[i][:msgs[i].msg_len],
+             (socket.inet_ntoa(bytes(names[i].sin_addr)), socket.ntohs(names[i].sin_port)))
+            for i in range(count)
+        ]
+    
+    return receive
+
+def receive_loop(sock, stats, stop_event, label=''):
+    """Receive and process packets from one socket until stop_event is set.
+
+    Every packet of a stream is sent from the same ForkStream socket, so with
+    SO_REUSEPORT the kernel always delivers a given stream to the same worker
+    and workers never share stream state.
+    """
     # Audio accumulation storage
-    # Structure: {stream_id: {direction: {'audio_data': bytes, 'call_info': dict, 'last_activity': timestamp}}}
-    audio_buffers = defaultdict(lambda: {
-        DIRECTION_RX: {'audio_data': b'', 'call_info': {}, 'last_activity': None},
-        DIRECTION_TX: {'audio_data': b'', 'call_info': {}, 'last_activity': None}
-    })
+    audio_buffers = {}  # {stream_id: StreamBuffer}
     
     # Track active streams
     active_streams = set()
+    # Min-heap of (expiry deadline, stream_id), one entry per active stream.
+    # Deadlines are only refreshed when an entry reaches the top of the heap.
+    expiry_heap = []
+    next_cleanup = time.monotonic() + CLEANUP_INTERVAL
+    
+    # Packets are memoryview slices of a reused receive buffer, so anything
+    # kept past the current batch must be copied out (file writes copy)
+    receive = make_batch_receiver(sock)
+    
+    # Counters live in locals on the hot path and are copied into stats
+    # whenever stats are printed and when the worker exits
+    sig_rx = sig_tx = aud_rx = aud_tx = total_bytes = errors = 0
     
     try:
-        while True:
-            # Receive packet
-            data, addr = sock.recvfrom(65536)
-            receive_time = datetime.now().strftime('%H:%M:%S.%f')[:-3]
+        while not stop_event.is_set():
+            # Receive the next batch of packets
+            packets = receive()
+            current_time = time.monotonic()
             
-            # Parse header
-            header = parse_forkstream_header(data)
-            if not header:
-                print(f"[{receive_time}] ERROR: Invalid header from {addr}")
-                stats['errors'] += 1
-                continue
-            
-            # Validate packet length
-            if len(data) != header['packet_length']:
-                print(f"[{receive_time}] ERROR: Packet length mismatch. Expected {header['packet_length']}, got {len(data)}")
-                stats['errors'] += 1
-                continue
-            
-            stream_id = header['stream_id']
-            direction = header['direction']
-            direction_str = direction_to_string(direction)
-            
-            # Process packet based on type
-            if header['packet_type'] == PACKET_TYPE_SIGNALING:
-                payload = parse_signaling_packet(data[8:])
-                if payload:
-                    print(f"[{receive_time}] SIGNALING {direction_str} from {addr}")
-                    print(f"  Stream ID: {stream_id}")
-                    print(f"  Channel: {payload['channel_id']}")
-                    print(f"  Extension: {payload['exten']}")
-                    print(f"  Caller ID: {payload['caller_id']}")
-                    print(f"  Called ID: {payload['called_id']}")
-                    print(f"  Timestamp: {payload['timestamp_str']}")
-                    
-                    # Store call info for this stream
-                    audio_buffers[stream_id][direction]['call_info'] = payload
-                    audio_buffers[stream_id][direction]['last_activity'] = time.time()
-                    active_streams.add(stream_id)
-                    
-                    if direction_str == "RX":
-                        stats['signaling_rx'] += 1
+            for data, addr in packets:
+                # Parse header
+                header = parse_forkstream_header(data)
+                if header is None:
+                    print(f"[{_now_str()}] ERROR: Invalid header from {addr}")
+                    errors += 1
+                    continue
+                packet_type, packet_length, stream_id, direction = header
+                
+                # Validate packet length
+                if len(data) != packet_length:
+                    print(f"[{_now_str()}] ERROR: Packet length mismatch. Expected {packet_length}, got {len(data)}")
+                    errors += 1
+                    continue
+                
+                direction_str = direction_to_string(direction)
+                
+                # Process packet based on type
+                if packet_type == PACKET_TYPE_SIGNALING:
+                    payload = parse_signaling_packet(data[8:])
+                    if payload is not None:
+                        print(f"[{_now_str()}] SIGNALING {direction_str} from {addr}")
+                        print(f"  Stream ID: {stream_id}")
+                        print(f"  Channel: {payload.channel_id}")
+                        print(f"  Extension: {payload.exten}")
+                        print(f"  Caller ID: {payload.caller_id}")
+                        print(f"  Called ID: {payload.called_id}")
+                        print(f"  Timestamp: {_fmt_ts(payload.timestamp)}")
+                        
+                        # Store call info for this stream
+                        stream = audio_buffers.get(stream_id)
+                        if stream is None:
+                            stream = audio_buffers[stream_id] = StreamBuffer()
+                        if direction == DIRECTION_RX:
+                            stream.rx_info = payload
+                            stream.last_rx = current_time
+                            sig_rx += 1
+                        else:
+                            stream.tx_info = payload
+                            stream.last_tx = current_time
+                            sig_tx += 1
+                        if stream_id not in active_streams:
+                            active_streams.add(stream_id)
+                            heapq.heappush(expiry_heap, (current_time + STREAM_TIMEOUT, stream_id))
                     else:
-                        stats['signaling_tx'] += 1
-                else:
-                    print(f"[{receive_time}] ERROR: Invalid signaling packet")
-                    stats['errors'] += 1
-                    
-            elif header['packet_type'] == PACKET_TYPE_AUDIO:
-                payload = parse_audio_packet(data[8:])
-                if payload:
-                    print(f"[{receive_time}] AUDIO {direction_str} from {addr} - Stream: {stream_id}, Seq: {payload['sequence']}, Size: {payload['audio_length']} bytes")
-                    
-                    # Accumulate audio data
-                    audio_buffers[stream_id][direction]['audio_data'] += payload['audio_data']
-                    audio_buffers[stream_id][direction]['last_activity'] = time.time()
-                    active_streams.add(stream_id)
-                    
-                    stats['total_audio_bytes'] += payload['audio_length']
-                    if direction_str == "RX":
-                        stats['audio_rx'] += 1
+                        print(f"[{_now_str()}] ERROR: Invalid signaling packet")
+                        errors += 1
+                        
+                elif packet_type == PACKET_TYPE_AUDIO:
+                    payload = parse_audio_packet(data[8:])
+                    if payload is not None:
+                        sequence, audio_data = payload
+                        audio_length = len(audio_data)
+                        if VERBOSE:
+                            print(f"[{_now_str()}] AUDIO {direction_str} from {addr} - Stream: {stream_id}, Seq: {sequence}, Size: {audio_length} bytes")
+                        
+                        # Write audio straight to this direction's recording file
+                        stream = audio_buffers.get(stream_id)
+                        if stream is None:
+                            stream = audio_buffers[stream_id] = StreamBuffer()
+                        # A failed open/write (EMFILE, ENOSPC, EIO...) only drops this direction's audio
+                        if direction == DIRECTION_RX:
+                            if not stream.rx_failed:
+                                try:
+                                    audio_file = stream.rx_file
+                                    if audio_file is None:
+                                        audio_file = stream.rx_file = open_audio_file(stream_id, DIRECTION_RX)
+                                    audio_file.write(audio_data)
+                                    stream.rx_bytes += audio_length
+                                except OSError as e:
+                                    print(f"Error recording RX audio for stream {stream_id}, dropping further audio: {e}")
+                                    stream.rx_failed = True
+                                    errors += 1
+                            stream.last_rx = current_time
+                            aud_rx += 1
+                        else:
+                            if not stream.tx_failed:
+                                try:
+                                    audio_file = stream.tx_file
+                                    if audio_file is None:
+                                        audio_file = stream.tx_file = open_audio_file(stream_id, DIRECTION_TX)
+                                    audio_file.write(audio_data)
+                                    stream.tx_bytes += audio_length
+                                except OSError as e:
+                                    print(f"Error recording TX audio for stream {stream_id}, dropping further audio: {e}")
+                                    stream.tx_failed = True
+                                    errors += 1
+                            stream.last_tx = current_time
+                            aud_tx += 1
+                        if stream_id not in active_streams:
+                            active_streams.add(stream_id)
+                            heapq.heappush(expiry_heap, (current_time + STREAM_TIMEOUT, stream_id))
+                        
+                        total_bytes += audio_length
                     else:
-                        stats['audio_tx'] += 1
+                        print(f"[{_now_str()}] ERROR: Invalid audio packet")
+                        errors += 1
+                        
                 else:
-                    print(f"[{receive_time}] ERROR: Invalid audio packet")
-                    stats['errors'] += 1
-                    
-            else:
-                print(f"[{receive_time}] ERROR: Unknown packet type {header['packet_type']}")
-                stats['errors'] += 1
-            
-            # Check for inactive streams (no activity for 30 seconds) and save audio
-            current_time = time.time()
-            inactive_streams = set()
+                    print(f"[{_now_str()}] ERROR: Unknown packet type {packet_type}")
+                    errors += 1
+                
+                # Print stats every 100 packets
+                total_packets = sig_rx + sig_tx + aud_rx + aud_tx
+                if total_packets > 0 and total_packets % 100 == 0:
+                    stats.update(signaling_rx=sig_rx, signaling_tx=sig_tx, audio_rx=aud_rx,
+                                 audio_tx=aud_tx, total_audio_bytes=total_bytes, errors=errors)
+                    print(f"\n--- STATS{label} (Total: {total_packets}) ---")
+                    print(f"Signaling: RX={stats['signaling_rx']}, TX={stats['signaling_tx']}")
+                    print(f"Audio: RX={stats['audio_rx']}, TX={stats['audio_tx']}")
+                    print(f"Total audio data: {stats['total_audio_bytes']:,} bytes")
+                    print(f"Active streams: {len(active_streams)}")
+                    print(f"Errors: {stats['errors']}")
+                    print("-" * 60)
             
-            for stream_id in active_streams:
-                stream_inactive = True
-                for direction in [DIRECTION_RX, DIRECTION_TX]:
-                    buffer = audio_buffers[stream_id][direction]
-                    if buffer['last_activity'] and (current_time - buffer['last_activity']) < 30:
-                        stream_inactive = False
-                        break
+            # Check for inactive streams (no activity for STREAM_TIMEOUT seconds) and save audio
+            # Runs once per batch (including empty ones after a receive timeout), at most
+            # every CLEANUP_INTERVAL, and only looks at streams whose deadline has passed
+            if current_time >= next_cleanup:
+                next_cleanup = current_time + CLEANUP_INTERVAL
+                
+                # Push out buffered log lines (verbose mode disables line buffering)
+                sys.stdout.flush()
                 
-                if stream_inactive:
-                    inactive_streams.add(stream_id)
-                    print(f"\n[INFO] Stream {stream_id} inactive for 30 seconds, saving audio files...")
+                while expiry_heap and expiry_heap[0][0] <= current_time:
+                    _, stream_id = heapq.heappop(expiry_heap)
+                    stream = audio_buffers[stream_id]
+                    last_activity = max(stream.last_rx, stream.last_tx)
+                    
+                    if current_time - last_activity < STREAM_TIMEOUT:
+                        # Stale deadline; the stream saw traffic since it was pushed
+                        heapq.heappush(expiry_heap, (last_activity + STREAM_TIMEOUT, stream_id))
+                        continue
                     
-                    # Save audio for both directions
-                    for direction in [DIRECTION_RX, DIRECTION_TX]:
-                        buffer = audio_buffers[stream_id][direction]
-                        if buffer['audio_data']:
-                            save_audio_file(stream_id, direction, buffer['audio_data'], buffer['call_info'])
+                    print(f"\n[INFO] Stream {stream_id} inactive for {STREAM_TIMEOUT} seconds, saving audio files...")
                     
-                    # Clear buffers for this stream
+                    save_stream_audio(stream_id, stream)
+                    
+                    # Clear buffers and stop tracking this stream
                     del audio_buffers[stream_id]
-            
-            # Remove inactive streams from tracking
-            active_streams -= inactive_streams
-            
-            # Print stats every 100 packets
-            total_packets = stats['signaling_rx'] + stats['signaling_tx'] + stats['audio_rx'] + stats['audio_tx']
-            if total_packets > 0 and total_packets % 100 == 0:
-                print(f"\n--- STATS (Total: {total_packets}) ---")
-                print(f"Signaling: RX={stats['signaling_rx']}, TX={stats['signaling_tx']}")
-                print(f"Audio: RX={stats['audio_rx']}, TX={stats['audio_tx']}")
-                print(f"Total audio data: {stats['total_audio_bytes']:,} bytes")
-                print(f"Active streams: {len(active_streams)}")
-                print(f"Errors: {stats['errors']}")
-                print("-" * 60)
-                
-    except KeyboardInterrupt:
-        print(f"\n\nSaving remaining audio data...")
+                    active_streams.discard(stream_id)
+                    
+    finally:
+        stats.update(signaling_rx=sig_rx, signaling_tx=sig_tx, audio_rx=aud_rx,
+                     audio_tx=aud_tx, total_audio_bytes=total_bytes, errors=errors)
         
         # Save all remaining audio data
         for stream_id in active_streams:
             print(f"Saving audio for stream {stream_id}...")
-            for direction in [DIRECTION_RX, DIRECTION_TX]:
-                buffer = audio_buffers[stream_id][direction]
-                if buffer['audio_data']:
-                    save_audio_file(stream_id, direction, buffer['audio_data'], buffer['call_info'])
-        
-        print(f"\nFinal Statistics:")
-        print(f"Signaling packets: RX={stats['signaling_rx']}, TX={stats['signaling_tx']}")
-        print(f"Audio packets: RX={stats['audio_rx']}, TX={stats['audio_tx']}")
-        print(f"Total audio data: {stats['total_audio_bytes']:,} bytes")
-        print(f"Errors: {stats['errors']}")
-        print("Receiver stopped.")
-    finally:
+            save_stream_audio(stream_id, audio_buffers[stream_id])
         sock.close()
 
+def main():
+    # Configuration
+    listen_ip = '0.0.0.0'
+    listen_port = 4444
+    
+    print(f"TLV UDP Receiver starting on {listen_ip}:{listen_port}")
+    print("Waiting for packets from ForkStream module...")
+    print(f"Audio recordings will be saved to '{RECORDINGS_DIR}/' directory")
+    if VERBOSE:
+        print("Per-packet audio logging enabled")
+        # Don't flush stdout on every audio line; workers flush it every CLEANUP_INTERVAL
+        sys.stdout.reconfigure(line_buffering=False)
+    else:
+        print("Per-packet audio logging disabled (set FORKSTREAM_VERBOSE=1 to enable)")
+    
+    os.makedirs(RECORDINGS_DIR, exist_ok=True)
+    
+    # Create one UDP socket per worker; the kernel caps SO_RCVBUF at net.core.rmem_max
+    socks = [create_socket(listen_ip, listen_port, WORKERS > 1) for _ in range(WORKERS)]
+    rcvbuf = socks[0].getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    print(f"Workers: {WORKERS}, socket receive buffer: {rcvbuf:,} bytes")
+    print("-" * 60)
+    
+    # Statistics, one dict per worker
+    worker_stats = [new_stats() for _ in socks]
+    
+    stop_event = threading.Event()
+    threads = []
+    for i, (sock, stats) in enumerate(zip(socks, worker_stats)):
+        label = f" [worker {i}]" if WORKERS > 1 else ''
+        thread = threading.Thread(target=receive_loop, args=(sock, stats, stop_event, label),
+                                  name=f"receiver-{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    
+    # Poll rather than join: a KeyboardInterrupt landing inside Thread.join()
+    # can leave the thread looking finished while it is still saving audio
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        print(f"\n\nSaving remaining audio data...")
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+    
+    stats = {key: sum(ws[key] for ws in worker_stats) for key in worker_stats[0]}
+    print(f"\nFinal Statistics:")
+    print(f"Signaling packets: RX={stats['signaling_rx']}, TX={stats['signaling_tx']}")
+    print(f"Audio packets: RX={stats['audio_rx']}, TX={stats['audio_tx']}")
+    print(f"Total audio data: {stats['total_audio_bytes']:,} bytes")
+    print(f"Errors: {stats['errors']}")
+    print("Receiver stopped.")
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -12,13 +12,16 @@ import struct
 import time
 from datetime import datetime
 
+# Payload sizes typical of common codecs' frames
+G711_FRAME_SIZES = frozenset((160, 320, 480, 960))  # Common for 8kHz/16kHz audio
+G729_FRAME_SIZES = frozenset((20, 33))
+
 def format_bytes(data, max_display=32):
     """Format bytes for display, showing hex values"""
     if len(data) <= max_display:
-        return ' '.join(f'{b:02x}' for b in data)
+        return data.hex(' ')
     else:
-        displayed = data[:max_display]
-        return ' '.join(f'{b:02x}' for b in displayed) + f' ... ({len(data)} bytes total)'
+        return data[:max_display].hex(' ') + f' ... ({len(data)} bytes total)'
 
 def main():
     if len(sys.argv) != 3:
@@ -59,9 +62,9 @@ def main():
                 # Try to detect common audio patterns
                 if len(data) >= 4:
                     # Check for common audio frame sizes
-                    if len(data) in [160, 320, 480, 960]:  # Common for 8kHz/16kHz audio
+                    if len(data) in G711_FRAME_SIZES:
                         print(f"  Note: Size suggests possible G.711/G.722 audio frame")
-                    elif len(data) in [20, 33]:  # Common for G.729
+                    elif len(data) in G729_FRAME_SIZES:
                         print(f"  Note: Size suggests possible G.729 audio frame")
                 
                 print()